@@ -53,6 +53,8 @@ The menus are:
     <li>Add Composer to Lookup - stores or updates the composer information in the lookup table. Composer View and Epoque tags must all be filled before the record can be updated.</li>
     <li>Add Conductor to Lookup - stores or updates the conductor information in the lookup table.</li>
     <li>Add Orchestra to Lookup - stores or updates the orchestra information in the lookup table.</li>
+    <li>Undo last classical fixes action - restores the tags changed by the last fix, combine or renumber action. Repeat it to undo earlier actions.</li>
+    <li>Export unresolved artists report - writes unresolved_artists.csv next to the plugin, listing names that were not found in the lookup, the tag they came from and how often they were seen, most frequent first.</li>
 </ol>
 
 '''
@@ -64,7 +66,11 @@ PLUGIN_LICENSE_URL = 'https://www.gnu.org/licenses/gpl.txt'
 from picard import log
 from picard.cluster import Cluster
 from picard.album import Album
+from picard.file import File, register_file_post_load_processor
+from picard.metadata import Metadata
+from picard.util import thread
 from picard.ui.itemviews import BaseAction, register_cluster_action, register_album_action, register_clusterlist_action, register_file_action, register_track_action
+from PyQt5 import QtCore
 import operator
 import types
 import re
@@ -72,6 +78,15 @@ import os
 import unicodedata
 import difflib
 import copy
+import json
+import hashlib
+import atexit
+import threading
+import weakref
+import tracemalloc
+import functools
+import contextlib
+from collections import OrderedDict, deque
 from difflib import SequenceMatcher
 from datetime import datetime
 
@@ -101,15 +116,77 @@ regexes = [
     ['\\s{2,}',' '] # remove duplicate spaces
 ]
 
+#Rules for the phonetic keys used to match transliteration variants of names (Tchaikovsky/Tschaikowsky, Rachmaninoff/Rakhmaninov). Applied in order to folded names.
+PHONETIC_RULES = [
+    ['tzsch|tsch|tch|sch|sh', 'X'], #sh and ch sounds in English, German and French spellings
+    ['ch', 'X'], #or K, in the alternate key
+    ['zh', 'J'],
+    ['kh', 'K'],
+    ['ph', 'F'],
+    ['th', 'T'],
+    ['ck|qu|q', 'K'],
+    ['x', 'KS'],
+    ['c(?=[eiy])', 'S'],
+    ['c', 'K'],
+    ['tz|ts|z', 'S'],
+    ['w|v|f', 'F'],
+    ['d', 'T']
+]
+PHONETIC_ALTERNATES = {'ch': 'K'}
+
 COMMON_SUFFIXES = ['jr', 'sr', 'jr.', 'sr.', 'i', 'ii', 'iii', 'iv', 'v', 'vi', 'vii', 'viii', 'ix', 'x', 'xi']
 
 DISC_RE = re.compile('(.*)[Dd][Ii][Ss][CcKk][ ]*([0-9]*)')
 
 AMP_RE = re.compile('([&]|[and]) ([Hh]is Orchestra|Chorus)')
 
+WORD_RE = re.compile('[^\\s,;&/:()\\[\\]-]+') #words of a free-form artist or album string, for finding known artists in it
+SEPARATOR_RE = re.compile('[,;&/:()\\[\\]]|\\s-\\s') #separators between the names in a free-form artist or album string
+ENSEMBLE_RE = re.compile('[Cc]hoir|[Cc]hor\\b|[Cc]horus|[Cc]ollegium|[Ss]cholars|[Ss]ingers|[Qq]uartet|[Qq]uintet|[Tt]rio\\b|[Cc]amerata|[Ss]oloists|[Pp]layers|[Kk]ammer') #ensembles not caught by ORCH_RE, which are often named after a composer
+ROLE_TAGS = ['composer', 'conductor', 'orchestra']
+
+MIN_MATCH_LENGTH = 4 #shortest folded name the artist matcher will match, so initials keys don't match stray letters
+PHONETIC_MIN_LENGTH = 6 #shortest folded name looked up by sound. Short names like Gold or Berg sound like too many others.
+
+FIX_ON_LOAD = False #set to True to do classical fixes automatically as files finish loading
+FIX_ON_LOAD_BATCH_SIZE = 20 #files fixed per timer tick when fixing on load
+FIX_ON_LOAD_INTERVAL = 50 #milliseconds between batches, so the UI stays responsive
+FIX_ON_LOAD_SETTLE = 2000 #milliseconds without newly loaded files before album level consistency is checked
+
+ARTISTS_FILE = 'artists.csv'
+
+MEMORY_PROFILING = False #set to True to measure memory use of the main actions and of loading and saving the lookup
+MEMORY_PROFILE_TOP = 10 #allocation sites reported per action
+MEMORY_PROFILE_FILE = 'memory_profile.csv' #one line per profiled action, for tracking memory use over time
+
+TITLE_CACHE_FILE = 'titlecache.json'
+TITLE_CACHE_SIZE = 20000
+
+PHONETIC_INDEX_FILE = 'phonetic.json'
+
+UNDO_ACTIONS = 20 #number of actions that can be undone
+UNDO_ENTRIES = 200000 #tag changes kept for undo. The oldest actions are dropped beyond this.
+
+RESOLVE_CACHE_FILE = 'resolvecache.json'
+RESOLVE_CACHE_SIZE = 20000
+RESOLVE_CACHE_VERSION = 2 #bump whenever the artist resolution code changes, so cached results from older code are dropped
+#every tag resolveArtists reads or writes is an input, so tags it leaves alone come out unchanged
+RESOLVE_INPUT_TAGS = ['artist', 'album artist', 'albumartist', 'albumArtist', 'composer', 'composer view', 'composersort', 'conductor', 'orchestra', 'epoque']
+RESOLVE_OUTPUT_TAGS = ['artist', 'album artist', 'albumartist', 'albumArtist', 'composer', 'composer view', 'composersort', 'conductor', 'orchestra', 'epoque']
+ALBUM_DEPENDENT = 'album' #cached in place of a result that depends on the album title
+
+MISS_CACHE_SIZE = 5000 #names remembered as not being in the lookup
+MISS_REPORT_FILE = 'misses.json'
+MISS_REPORT_SIZE = 5000 #names counted in the miss report. The least frequent are dropped beyond this.
+MISS_EXPORT_FILE = 'unresolved_artists.csv'
+
 #given an input, makes a unique by hashing the value. Replaces non-ascii characters with equivelents (for the most part) and strips punctuation, then coverts to lower case.
 def makeKey(inputstring):
     log.debug('making key for: ' + str(inputstring))
+    return foldName(inputstring)
+
+#does the work of makeKey, without the logging. Used on single words when scanning strings for known artists.
+def foldName(inputstring):
     stripped = ''.join(c for c in unicodedata.normalize('NFD', inputstring)
                   if unicodedata.category(c) != 'Mn')
     stripped = stripped.replace('-','')
@@ -152,11 +229,13 @@ class ArtistLookup():
         self.primaryrole = role.strip()
         self.primaryepoque = epoque.strip()
 
+SIMILARITY_THRESHOLD = .85
+
 #Return true if the 2 string a close. Useful for detecting common misspellings.
 def AreSimilar(str1, str2):
     similarity = SequenceMatcher(None, str1, str2).ratio()
     #log.debug(str1 + ' and ' + str2 + ' have similarity of ' + str(similarity))
-    return similarity > .85
+    return similarity > SIMILARITY_THRESHOLD
 
 #given a string in FName LName order, returns the last name. Common suffixes are handled.
 def getLastName(inputString):
@@ -201,16 +280,117 @@ def upsertArtist(artistDict, name, sortOrderName, sortOrderNameWithDates, primar
     log.debug('CLASSICAL FIXES: Completed upserting artist: ' + name)
     return
 
+#The most recent memory reports, as dictionaries, when MEMORY_PROFILING is on
+memoryReports = deque(maxlen=50)
+
+#Measures the memory used by the code run inside it with tracemalloc, when MEMORY_PROFILING is on. Logs the peak and retained memory,
+#bytes per processed file and the top allocation sites, and appends a line to the memory profile file so regressions can be tracked.
+@contextlib.contextmanager
+def memoryProfile(name, fileCount=0):
+    if not MEMORY_PROFILING:
+        yield
+        return
+    startedTracing = not tracemalloc.is_tracing()
+    if startedTracing:
+        tracemalloc.start()
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+    startSize = tracemalloc.get_traced_memory()[0]
+    before = tracemalloc.take_snapshot()
+    try:
+        yield
+    finally:
+        try:
+            size, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+            topStats = after.compare_to(before.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)]), 'lineno')[:MEMORY_PROFILE_TOP]
+            report = {
+                'action': name,
+                'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                'files': fileCount,
+                'peak': peak - startSize,
+                'retained': size - startSize,
+                'perfile': (peak - startSize) // fileCount if fileCount else 0,
+                'top': [str(stat) for stat in topStats]
+            }
+            memoryReports.append(report)
+            log.info('CLASSICAL FIXES: Memory for %s: peak %i bytes, retained %i bytes, %i files, %i bytes per file' % (name, report['peak'], report['retained'], fileCount, report['perfile']))
+            for stat in report['top']:
+                log.info('CLASSICAL FIXES:     ' + stat)
+            with open(pluginFilePath(MEMORY_PROFILE_FILE), 'a', encoding='utf-8') as profileFile:
+                profileFile.write('|'.join(str(report[field]) for field in ['date', 'action', 'files', 'peak', 'retained', 'perfile']) + '\n')
+        except Exception as e:
+            log.error('CLASSICAL FIXES: Error profiling memory: ' + str(e))
+        if startedTracing:
+            tracemalloc.stop()
+
+#Decorator that runs a function inside memoryProfile. countFiles is called with the same arguments and returns the number of files processed.
+def memoryProfiled(name, countFiles=None):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args):
+            if not MEMORY_PROFILING:
+                return func(*args)
+            with memoryProfile(name, countFiles(*args) if countFiles else 0):
+                return func(*args)
+        return wrapper
+    return decorator
+
+#Counts the files in the clusters selected for a cluster action
+def clusterFileCount(action, objs):
+    return sum(len(cluster.files) for cluster in objs if isinstance(cluster, Cluster) and cluster.files)
+
+#Counts the files selected for a file action
+def fileCount(action, objs):
+    return len(objs)
+
+#Makes the lookup file line for an artist
+def artistLine(artist):
+    return artist.key + '|' + artist.name + '|' + artist.sortorder + '|' + artist.sortorderwithdates + '|' + artist.primaryrole + '|' + artist.primaryepoque
+
+#Parses a line of the lookup file. Returns None if the line is not an artist record.
+def parseArtistLine(artistline):
+    parts = artistline.split('|')
+    if len(parts)>5:
+        return ArtistLookup(parts[0],parts[1],parts[2],parts[3],parts[4],parts[5])
+    return None
+
+#Returns the (modification time, size) of the artist lookup file, or None if there is no file. Used to notice when the file changes outside the plugin.
+def artistFileState():
+    try:
+        stat = os.stat(pluginFilePath(ARTISTS_FILE))
+        return (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return None
+
+#Reads the lines of the artist lookup file and returns them keyed by artist key, along with a hash of the file contents.
+def readArtistRows():
+    with open(pluginFilePath(ARTISTS_FILE), 'r', encoding='utf-8') as artistfile:
+        content = artistfile.read()
+    rows = {}
+    for artistline in content.splitlines():
+        parts = artistline.split('|')
+        if len(parts)>5:
+            rows[parts[0].strip()] = artistline
+    return rows, hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+#What the lookup file looked like the last time the plugin read or wrote it. Rows are the raw lines keyed by artist key.
+artistFileRows = {}
+artistFileHash = ''
+artistFileLastState = None
+
 #Reads the artist lookup file and returns it as a dictionary of ArtistLookup objects.        
+@memoryProfiled('Read artists')
 def readArtists():
+    global artistFileRows, artistFileHash, artistFileLastState
     try:
         log.debug('CLASSICAL FIXES: Script path: ' + os.path.dirname(os.path.abspath(__file__)))
-        filepath = os.path.dirname(os.path.abspath(__file__)) + '/artists.csv'
+        filepath = pluginFilePath(ARTISTS_FILE)
         if os.path.exists(filepath):
             log.debug('CLASSICAL FIXES: File exists')
             try:
-                with open(filepath, 'r', encoding='utf-8') as artistfile:
-                    artistlines = artistfile.readlines()
+                state = artistFileState()
+                rows, contentHash = readArtistRows()
                 log.debug('CLASSICAL FIXES: File read successfully')
             except Exception as e:
                 log.error('CLASSICAL FIXES: Error opening artists file: ' + str(e))
@@ -221,30 +401,82 @@ def readArtists():
         
         #populate the lookup
         artistLookup = {} #dictionary of artists in the lookup table
-        for artistline in artistlines:
-            parts = artistline.split('|')
-            if len(parts)>5:
-                art = ArtistLookup(parts[0],parts[1],parts[2],parts[3],parts[4],parts[5])
-                artistLookup[art.key] = art
+        for artistline in rows.values():
+            art = parseArtistLine(artistline)
+            artistLookup[art.key] = art
         
+        artistFileRows = rows
+        artistFileHash = contentHash
+        artistFileLastState = state
         log.info('CLASSICAL FIXES: Successfully read artists file and loaded %i artists.' % len(artistLookup))
         
         return artistLookup
     except Exception as e:
         log.error('CLASSICAL FIXES: Error reading artists: ' + str(e))
 
-#Saves the artist lookup file
+#Checks whether the artist lookup file was changed outside the plugin (by hand or from another workstation) since it was last read or written.
+#If so, only the rows that changed on disk are applied to the lookup. Rows that were also changed in the plugin since then keep the plugin's version.
+#Returns True if the lookup changed.
+def refreshArtists(artistDict):
+    global artistFileRows, artistFileHash, artistFileLastState
+    try:
+        state = artistFileState()
+        if state is None or state == artistFileLastState:
+            return False
+        rows, contentHash = readArtistRows()
+        artistFileLastState = state
+        if contentHash == artistFileHash:
+            return False
+        
+        changedKeys = [key for key, line in rows.items() if artistFileRows.get(key) != line]
+        removedKeys = [key for key in artistFileRows if key not in rows]
+        applied = 0
+        for key in changedKeys + removedKeys:
+            oldLine = artistFileRows.get(key)
+            oldArtist = parseArtistLine(oldLine) if oldLine is not None else None
+            localArtist = artistDict.get(key)
+            #a row that differs from what was last on disk was changed in the plugin. Keep it rather than clobbering it.
+            if (localArtist and not oldArtist) or (localArtist and oldArtist and artistLine(localArtist) != artistLine(oldArtist)):
+                log.info('CLASSICAL FIXES: Keeping local version of ' + key + ' over the lookup file.')
+                continue
+            if key in rows:
+                artistDict[key] = parseArtistLine(rows[key])
+            else:
+                artistDict.pop(key, None)
+            applied += 1
+        
+        artistFileRows = rows
+        artistFileHash = contentHash
+        log.info('CLASSICAL FIXES: Artists file changed on disk. Applied %i changed and removed rows.' % applied)
+        return applied > 0
+    except Exception as e:
+        log.error('CLASSICAL FIXES: Error refreshing artists: ' + str(e))
+        return False
+
+#Saves the artist lookup file. Changes made to the file outside the plugin since it was last read are merged in first, so they are not overwritten.
+#Returns True if merging changed the lookup.
+@memoryProfiled('Save artists')
 def saveArtists(artistDict):
+    changed = False
+    global artistFileRows, artistFileHash, artistFileLastState
     try:
-        filepath = os.path.dirname(os.path.abspath(__file__)) + '/artists.csv'
+        changed = refreshArtists(artistDict)
+        filepath = pluginFilePath(ARTISTS_FILE)
         
+        rows = {}
         with open(filepath, 'w', encoding='utf-8') as artistFile:
             for key, artist in artistDict.items():
-                line = artist.key + '|' + artist.name + '|' + artist.sortorder + '|' + artist.sortorderwithdates + '|' + artist.primaryrole + '|' + artist.primaryepoque    
+                line = artistLine(artist)
+                rows[artist.key] = line
                 artistFile.write(line + '\n')
+        
+        artistFileRows = rows
+        artistFileHash = hashlib.sha1(''.join(line + '\n' for line in rows.values()).encode('utf-8')).hexdigest()
+        artistFileLastState = artistFileState()
         log.info('CLASSICAL FIXES: Successfully saved artists lookup file.')
     except Exception as e:
         log.error('CLASSICAL FIXES: Error occured saving artists: ' + str(e))
+    return changed
 
 #For tags where multiple values are stored in one semi-colon separated string, expands them into an array.
 def expandList(thelist, splitchar=';'):
@@ -278,6 +510,183 @@ def expandList(thelist, splitchar=';'):
     except Exception as e:
         log.error('CLASSICAL FIXES: Error expanding list: ' + str(e))
 
+#Returns the full path of a file stored next to the plugin, such as the lookup table or one of the caches.
+def pluginFilePath(filename):
+    return os.path.dirname(os.path.abspath(__file__)) + '/' + filename
+
+#A size bounded cache that evicts the least recently used entries. When a filename is given, the cache is loaded lazily from and saved to a json file next to the plugin.
+#The signature describes whatever the cached values were computed with. A cache file saved with a different signature is discarded on load.
+class LRUCache():
+
+    def __init__(self, maxsize, filename=None, signature=''):
+        self.maxsize = maxsize
+        self.filename = filename
+        self.signature = signature
+        self.entries = OrderedDict()
+        self.loaded = filename is None
+        self.dirty = False
+
+    def load(self):
+        self.loaded = True
+        try:
+            filepath = pluginFilePath(self.filename)
+            if not os.path.exists(filepath):
+                return
+            with open(filepath, 'r', encoding='utf-8') as cacheFile:
+                data = json.load(cacheFile)
+            if data.get('signature') != self.signature:
+                log.info('CLASSICAL FIXES: Discarding stale cache ' + self.filename)
+                self.dirty = True
+                return
+            for key, value in data.get('entries', []):
+                self.entries[key] = value
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+            log.debug('CLASSICAL FIXES: Loaded %i entries from %s' % (len(self.entries), self.filename))
+        except Exception as e:
+            log.error('CLASSICAL FIXES: Error loading cache ' + self.filename + ': ' + str(e))
+
+    def get(self, key, default=None):
+        if not self.loaded:
+            self.load()
+        if key not in self.entries:
+            return default
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, key, value):
+        if not self.loaded:
+            self.load()
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        self.dirty = True
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def save(self):
+        if not self.filename or not self.dirty:
+            return
+        try:
+            with open(pluginFilePath(self.filename), 'w', encoding='utf-8') as cacheFile:
+                json.dump({'signature': self.signature, 'entries': list(self.entries.items())}, cacheFile)
+            self.dirty = False
+            log.debug('CLASSICAL FIXES: Saved %i entries to %s' % (len(self.entries), self.filename))
+        except Exception as e:
+            log.error('CLASSICAL FIXES: Error saving cache ' + self.filename + ': ' + str(e))
+
+#Makes a signature for a rule set, so caches computed with a different set of rules are thrown away.
+def rulesSignature(rules):
+    return hashlib.sha1(repr(rules).encode('utf-8')).hexdigest()
+
+#Cache of raw title -> normalized title. Work titles repeat heavily across a library, so most titles skip the regexes entirely.
+titleCache = LRUCache(TITLE_CACHE_SIZE, TITLE_CACHE_FILE, rulesSignature(regexes))
+
+#Runs the regexes on a track or album title, using the title cache when the title has been seen before.
+def normalizeTitle(title):
+    normalized = titleCache.get(title)
+    if normalized is None:
+        normalized = title
+        for regex in regexes:
+            normalized = re.sub(regex[0], regex[1], normalized)
+        titleCache.put(title, normalized)
+    return normalized
+
+#Writes the persistent caches to disk. Called once per action, at the end of fixing files on load and when Picard exits.
+def saveCaches():
+    titleCache.save()
+    resolveCache.save()
+    missReport.save()
+
+atexit.register(saveCaches)
+
+#Journal of the tag changes made by the plugin's actions, so the last actions can be undone without reloading the files.
+#An action keeps (file, tag, old values) for each tag it changed rather than copies of the metadata. Files are held weakly, so removed files are not kept alive.
+class UndoJournal():
+
+    def __init__(self, maxActions, maxEntries):
+        self.maxActions = maxActions
+        self.maxEntries = maxEntries
+        self.actions = deque() #(action name, list of (file reference, tag, old values)), oldest first
+        self.entryCount = 0
+        self.current = None
+        self.lock = threading.Lock()
+
+    #Starts recording an action. An action that was not committed is committed first.
+    def begin(self, name):
+        self.commit()
+        with self.lock:
+            self.current = (name, {})
+
+    #Sets the current action aside without committing it, so it can be continued later with resume. Returns the action.
+    def suspend(self):
+        with self.lock:
+            action = self.current
+            self.current = None
+            return action
+
+    #Continues an action set aside with suspend, or starts a new one with the given name if there is none. An action in progress is committed first.
+    def resume(self, action, name):
+        if action is None:
+            self.begin(name)
+            return
+        self.commit()
+        with self.lock:
+            self.current = action
+
+    #Records the values of a tag before the current action changes it. Only the first change to each tag in an action is kept.
+    def record(self, obj, tag, oldValues=None):
+        with self.lock:
+            if self.current is None:
+                return
+            entries = self.current[1]
+            if (id(obj), tag) not in entries:
+                entries[(id(obj), tag)] = (weakref.ref(obj), tag, obj.metadata.getall(tag) if oldValues is None else oldValues)
+
+    #Records every tag that differs between the file and a copy of its metadata taken before it was changed.
+    def recordChanges(self, f, savedMetadata):
+        for tag in set(savedMetadata.keys()) | set(f.metadata.keys()):
+            if savedMetadata.getall(tag) != f.metadata.getall(tag):
+                self.record(f, tag, savedMetadata.getall(tag))
+
+    def commit(self):
+        with self.lock:
+            if self.current is None:
+                return
+            name, entries = self.current
+            self.current = None
+            if not entries:
+                return
+            self.actions.append((name, list(entries.values())))
+            self.entryCount += len(entries)
+            while len(self.actions) > self.maxActions or (self.entryCount > self.maxEntries and len(self.actions) > 1):
+                self.entryCount -= len(self.actions.popleft()[1])
+            log.debug('CLASSICAL FIXES: Journaled %i tag changes for %s' % (len(entries), name))
+
+    #Restores the tags changed by the last count actions, most recent first. Returns the number of actions undone.
+    def undo(self, count=1):
+        undone = 0
+        changed = {}
+        with self.lock:
+            while undone < count and self.actions:
+                name, entries = self.actions.pop()
+                self.entryCount -= len(entries)
+                for ref, tag, oldValues in reversed(entries):
+                    obj = ref()
+                    if obj is None or getattr(obj, 'state', None) == File.REMOVED:
+                        continue
+                    if oldValues:
+                        obj.metadata[tag] = oldValues
+                    elif tag in obj.metadata:
+                        del obj.metadata[tag]
+                    changed[id(obj)] = obj
+                log.info('CLASSICAL FIXES: Undid ' + name)
+                undone += 1
+        for obj in changed.values():
+            obj.update()
+        return undone
+
+undoJournal = UndoJournal(UNDO_ACTIONS, UNDO_ENTRIES)
+
 #makes a sorting key for a track. 
 def track_key(track):
     return str(track.metadata['albumartist']) + str(track.metadata['album']) + str(track.metadata['discnumber']).zfill(4) + str(track.metadata['tracknumber']).zfill(7)
@@ -293,6 +702,8 @@ def RenumberFiles(files):
             currTrack = 1
             currAlbum = file.metadata['album']
             currAlbumArtist = file.metadata['albumartist']
+        for tag in ['origdiscnumber', 'origtracknumber', 'discnumber', 'tracknumber']:
+            undoJournal.record(file, tag)
         if file.metadata['discnumber'] != '1':
             file.metadata['origdiscnumber'] = file.metadata['discnumber']
         if file.metadata['tracknumber'] != str(currTrack):
@@ -335,8 +746,396 @@ def rearrangeArtists(artists, f):
         return artists
         
 
-#Read the lookup table into a global variable    
-artistLookup = readArtists()
+#Finds every known artist in a free-form string, such as "Berliner Philharmoniker, Herbert von Karajan" or "Gould - Bach Goldberg Variations", in a single pass.
+#This is an Aho-Corasick automaton over the folded words of each lookup name. Whole names between separators are also looked up by key, which catches aliases such as last names and keys that are not spelled like the name.
+#A one-word name or alias only matches a whole segment, so "Glenn Gould", "Miles Davis" or "Various Artists" do not match Gould, Miles or Various. A segment naming an ensemble only matches orchestras, so "Monteverdi Choir" is not Monteverdi.
+class ArtistMatcher():
+
+    def __init__(self, artists):
+        self.artists = artists
+        self.transitions = [{}] #per state: folded word -> next state
+        self.failures = [0]
+        self.outputs = [[]] #per state: (number of words, artist) for each name ending in the state
+        for artist in artists.values():
+            self.addPattern([foldName(w) for w in WORD_RE.findall(artist.name)], artist)
+        self.buildFailures()
+        log.debug('CLASSICAL FIXES: Built artist matcher with %i states' % len(self.transitions))
+
+    def addPattern(self, words, artist):
+        words = [w for w in words if w]
+        if not words or len(''.join(words)) < MIN_MATCH_LENGTH:
+            return
+        state = 0
+        for word in words:
+            if word not in self.transitions[state]:
+                self.transitions.append({})
+                self.failures.append(0)
+                self.outputs.append([])
+                self.transitions[state][word] = len(self.transitions) - 1
+            state = self.transitions[state][word]
+        #the lookup has several keys for the same artist. Only keep one pattern per name.
+        for length, found in self.outputs[state]:
+            if found.name == artist.name:
+                return
+        self.outputs[state].append((len(words), artist))
+
+    def buildFailures(self):
+        queue = deque(self.transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for word, nextState in self.transitions[state].items():
+                queue.append(nextState)
+                failure = self.failures[state]
+                while failure and word not in self.transitions[failure]:
+                    failure = self.failures[failure]
+                self.failures[nextState] = self.transitions[failure].get(word, 0)
+                self.outputs[nextState] = self.outputs[nextState] + self.outputs[self.failures[nextState]]
+
+    #Returns (start, end, ArtistLookup, one word) for every known artist in the text, with character positions. One-word matches, mostly last names, can be turned off for noisier strings.
+    def find(self, text, aliases=True):
+        matches = []
+        bounds = [0]
+        for separator in SEPARATOR_RE.finditer(text):
+            bounds += [separator.start(), separator.end()]
+        bounds.append(len(text))
+        segments = [(bounds[i], bounds[i+1]) for i in range(0, len(bounds), 2)]
+        
+        #whole names between separators
+        for segmentStart, segmentEnd in segments:
+            segment = text[segmentStart:segmentEnd]
+            key = foldName(segment)
+            oneWord = len(segment.split()) == 1
+            if key in self.artists and (aliases or not oneWord):
+                start = segmentStart + len(segment) - len(segment.lstrip())
+                matches.append((start, start + len(segment.strip()), self.artists[key], oneWord))
+        
+        #names anywhere in the text, one word at a time
+        words = [(m.start(), m.end(), foldName(m.group())) for m in WORD_RE.finditer(text)]
+        words = [w for w in words if w[2]]
+        state = 0
+        for i, (start, end, word) in enumerate(words):
+            while state and word not in self.transitions[state]:
+                state = self.failures[state]
+            state = self.transitions[state].get(word, 0)
+            for length, artist in self.outputs[state]:
+                #a one-word name has to be the whole segment, which the key lookup above already covers
+                if length == 1 and (not aliases or text[start:end].strip() != segmentAt(text, segments, start).strip()):
+                    continue
+                matches.append((words[i - length + 1][0], end, artist, length == 1))
+        
+        #performers such as "Bach Collegium Japan" or "Tallis Scholars" are named after composers. Only orchestras match in them.
+        return [m for m in matches if m[2].primaryrole == 'Orchestra' or not isEnsemble(segmentAt(text, segments, m[0]))]
+
+#Returns the segment between separators containing the position, given (start, end) for each segment.
+def segmentAt(text, segments, position):
+    for start, end in segments:
+        if start <= position < end:
+            return text[start:end]
+    return ''
+
+#Returns True if a name looks like an ensemble rather than a person.
+def isEnsemble(name):
+    return bool(ORCH_RE.search(name) or ENSEMBLE_RE.search(name))
+
+#Reduces matches from ArtistMatcher.find to the longest match at each position, dropping matches that overlap one already kept.
+def longestMatches(matches):
+    kept = []
+    lastEnd = -1
+    for start, end, artist, oneWord in sorted(matches, key=lambda m: (m[0], m[0] - m[1])):
+        if start >= lastEnd:
+            kept.append((start, end, artist, oneWord))
+            lastEnd = end
+    return kept
+
+#Spells a folded name the way it sounds, using the phonetic rules. The alternate spelling reads ch as K instead of as sh.
+def phoneticSkeleton(folded, alternate=False):
+    skeleton = folded
+    for rule in PHONETIC_RULES:
+        replacement = PHONETIC_ALTERNATES.get(rule[0], rule[1]) if alternate else rule[1]
+        skeleton = re.sub(rule[0], replacement, skeleton)
+    return skeleton.upper()
+
+#Makes a phonetic key for a folded name: its phonetic skeleton without vowels after the first letter and without repeated sounds. Tchaikovsky, Chaikovsky and Tschaikowsky are all XKFSK.
+def phoneticKey(folded, alternate=False):
+    skeleton = phoneticSkeleton(folded, alternate)
+    if not skeleton:
+        return ''
+    first = 'A' if skeleton[0] in 'AEIOUY' else skeleton[0]
+    return re.sub('(.)\\1+', '\\1', first + re.sub('[AEIOUYHJ]', '', skeleton[1:]))
+
+#Index of lookup keys by phonetic key (primary and alternate), used to find candidates for names that are spelled differently from the lookup.
+#It only depends on the lookup keys, so it is saved next to the plugin with a signature of the keys and rules and reused at the next start.
+class PhoneticIndex():
+
+    def __init__(self, artists):
+        self.index = {}
+        keys = sorted(key for key in artists if len(key) >= MIN_MATCH_LENGTH)
+        signature = rulesSignature([PHONETIC_RULES, PHONETIC_ALTERNATES, keys])
+        if not self.load(signature):
+            for key in keys:
+                for phonetic in dict.fromkeys([phoneticKey(key), phoneticKey(key, True)]):
+                    self.index.setdefault(phonetic, []).append(key)
+            self.save(signature)
+        log.debug('CLASSICAL FIXES: Phonetic index has %i keys' % len(self.index))
+
+    def load(self, signature):
+        try:
+            filepath = pluginFilePath(PHONETIC_INDEX_FILE)
+            if not os.path.exists(filepath):
+                return False
+            with open(filepath, 'r', encoding='utf-8') as indexFile:
+                data = json.load(indexFile)
+            if data.get('signature') != signature:
+                return False
+            self.index = data['index']
+            return True
+        except Exception as e:
+            log.error('CLASSICAL FIXES: Error loading phonetic index: ' + str(e))
+            return False
+
+    def save(self, signature):
+        try:
+            with open(pluginFilePath(PHONETIC_INDEX_FILE), 'w', encoding='utf-8') as indexFile:
+                json.dump({'signature': signature, 'index': self.index}, indexFile)
+        except Exception as e:
+            log.error('CLASSICAL FIXES: Error saving phonetic index: ' + str(e))
+
+    #Returns the lookup key that sounds like the folded name and is the most similar to it, if it passes the usual similarity check, or None.
+    def match(self, folded):
+        if len(folded) < PHONETIC_MIN_LENGTH:
+            return None
+        best = None
+        bestSimilarity = SIMILARITY_THRESHOLD
+        for phonetic in dict.fromkeys([phoneticKey(folded), phoneticKey(folded, True)]):
+            for candidate in self.index.get(phonetic, []):
+                similarity = SequenceMatcher(None, folded, candidate).ratio()
+                if similarity > bestSimilarity:
+                    best = candidate
+                    bestSimilarity = similarity
+        return best
+
+#An immutable version of the artist lookup. Readers take the current snapshot and use it without locking, so they never see a half-applied upsert.
+class ArtistLookupSnapshot():
+
+    def __init__(self, artists, version):
+        self.artists = types.MappingProxyType(artists)
+        self.version = version
+        self.artistMatcher = None
+        self.artistPhoneticIndex = None
+        self.artistDigest = None
+
+    #The matcher for this version of the lookup, built the first time it is needed.
+    def matcher(self):
+        if self.artistMatcher is None:
+            self.artistMatcher = ArtistMatcher(self.artists)
+        return self.artistMatcher
+
+    #A hash of the contents of this version of the lookup. Unlike the version number, it is the same across sessions for the same lookup.
+    def digest(self):
+        if self.artistDigest is None:
+            self.artistDigest = hashlib.sha1('\n'.join(artistLine(self.artists[key]) for key in sorted(self.artists)).encode('utf-8')).hexdigest()
+        return self.artistDigest
+
+    #The phonetic index for this version of the lookup, built or loaded the first time it is needed.
+    def phoneticIndex(self):
+        if self.artistPhoneticIndex is None:
+            self.artistPhoneticIndex = PhoneticIndex(self.artists)
+        return self.artistPhoneticIndex
+
+#Holds the current snapshot of the artist lookup. Writers copy the current version, change the copy and publish it as the next version in one assignment.
+#Writers are serialized by a lock. Readers only ever read the current attribute, so processing can run alongside curation without contention.
+class ArtistLookupStore():
+
+    def __init__(self, artists):
+        self.lock = threading.Lock()
+        self.current = ArtistLookupSnapshot(artists or {}, 0)
+
+    def snapshot(self):
+        return self.current
+
+    #Calls changeFunc with a copy of the lookup. If it returns True, the copy is published as the next version.
+    def update(self, changeFunc):
+        with self.lock:
+            artists = dict(self.current.artists)
+            if not changeFunc(artists):
+                return False
+            self.current = ArtistLookupSnapshot(artists, self.current.version + 1)
+            log.debug('CLASSICAL FIXES: Published artist lookup version %i' % self.current.version)
+            return True
+
+    #Upserts a list of (name, sortOrderName, sortOrderNameWithDates, primaryRole, epoque) records as a single new version.
+    #Records for the same name are upserted once, with the last record for the name winning as it would when upserting one at a time.
+    def upsert(self, records):
+        distinct = OrderedDict()
+        for record in records:
+            distinct[record[0]] = record
+        log.info('CLASSICAL FIXES: Upserting %i distinct names from %i tracks (%i upserts saved)' % (len(distinct), len(records), len(records) - len(distinct)))
+        def upsertAll(artists):
+            for record in distinct.values():
+                upsertArtist(artists, *record)
+            return len(distinct) > 0
+        return self.update(upsertAll)
+
+    #Picks up changes made to the lookup file outside the plugin. Only copies the lookup when the file has actually changed.
+    def refresh(self):
+        if artistFileState() == artistFileLastState:
+            return False
+        return self.update(refreshArtists)
+
+    def save(self):
+        return self.update(saveArtists)
+
+#Read the lookup table into the global store
+lookupStore = ArtistLookupStore(readArtists())
+
+#Counts how often names are not found in the lookup, by name and the tag they came from. The counts are kept across sessions
+#and can be exported, so curators can see which additions to the lookup would resolve the most tracks.
+class MissReport():
+
+    def __init__(self, maxsize, filename):
+        self.maxsize = maxsize
+        self.filename = filename
+        self.counts = None
+        self.dirty = False
+        self.lock = threading.Lock()
+
+    def load(self):
+        self.counts = {}
+        try:
+            filepath = pluginFilePath(self.filename)
+            if os.path.exists(filepath):
+                with open(filepath, 'r', encoding='utf-8') as reportFile:
+                    for name, role, count in json.load(reportFile):
+                        self.counts[(name, role)] = count
+        except Exception as e:
+            log.error('CLASSICAL FIXES: Error loading miss report: ' + str(e))
+
+    def record(self, name, role, count=1):
+        with self.lock:
+            if self.counts is None:
+                self.load()
+            self.counts[(name, role)] = self.counts.get((name, role), 0) + count
+            self.dirty = True
+            if len(self.counts) > self.maxsize:
+                #drop the least frequent tenth, so this doesn't happen on every new name
+                for key in sorted(self.counts, key=self.counts.get)[:len(self.counts) - self.maxsize * 9 // 10]:
+                    del self.counts[key]
+
+    #(name, role, count) for names that are still not in the lookup, most frequent first
+    def misses(self, lookup):
+        with self.lock:
+            if self.counts is None:
+                self.load()
+            return sorted([(name, role, count) for (name, role), count in self.counts.items() if makeKey(name) not in lookup.artists],
+                key=lambda miss: -miss[2])
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            try:
+                with open(pluginFilePath(self.filename), 'w', encoding='utf-8') as reportFile:
+                    json.dump([[name, role, count] for (name, role), count in self.counts.items()], reportFile)
+                self.dirty = False
+            except Exception as e:
+                log.error('CLASSICAL FIXES: Error saving miss report: ' + str(e))
+
+    #Writes the report as a pipe separated file, like the lookup file
+    def export(self, lookup):
+        filepath = pluginFilePath(MISS_EXPORT_FILE)
+        misses = self.misses(lookup)
+        with open(filepath, 'w', encoding='utf-8') as exportFile:
+            for name, role, count in misses:
+                exportFile.write(name + '|' + role + '|' + str(count) + '\n')
+        log.info('CLASSICAL FIXES: Exported %i unresolved artists to %s' % (len(misses), filepath))
+
+missReport = MissReport(MISS_REPORT_SIZE, MISS_REPORT_FILE)
+
+#Everything other than the lookup that artist resolution results depend on. Changing any of it invalidates the resolution cache.
+#The code itself is covered by the versions, since a change to resolveArtists or lookupArtist changes none of the rules.
+RESOLVE_RULES = [PLUGIN_VERSION, RESOLVE_CACHE_VERSION, SIMILARITY_THRESHOLD, ORCH_RE.pattern, AMP_RE.pattern, WORD_RE.pattern, SEPARATOR_RE.pattern, ENSEMBLE_RE.pattern, MIN_MATCH_LENGTH, COMMON_SUFFIXES, PHONETIC_RULES, PHONETIC_ALTERNATES, PHONETIC_MIN_LENGTH, RESOLVE_INPUT_TAGS, RESOLVE_OUTPUT_TAGS]
+
+resolveCache = LRUCache(RESOLVE_CACHE_SIZE, RESOLVE_CACHE_FILE)
+
+#Names recently not found in the lookup. It belongs to one lookup version and is replaced when a new version is published.
+missCache = LRUCache(MISS_CACHE_SIZE, signature=-1)
+
+#Resolves each distinct artist name of a selection of files once, instead of once per track. A name is resolved the first time a file
+#asks for it through lookupArtist, so files whose artist resolution is cached never cause a lookup. Results belong to one lookup snapshot.
+class NameBatch():
+
+    def __init__(self, lookup):
+        self.version = lookup.version
+        self.resolved = {}
+        self.trackLookups = 0
+
+    #Returns the ArtistLookup for a name from the given tag, or None. Misses are counted for every track, not once per name.
+    def resolve(self, lookup, name, role, misses):
+        if lookup.version != self.version:
+            return lookupArtist(lookup, name, role, misses)
+        self.trackLookups += 1
+        if (name, role) not in self.resolved:
+            self.resolved[(name, role)] = lookupArtist(lookup, name, role, [])
+        found = self.resolved[(name, role)]
+        if found is None:
+            recordMiss(name, role, misses)
+        return found
+
+    def report(self):
+        if self.trackLookups:
+            log.info('CLASSICAL FIXES: Resolved %i distinct names for %i track-level lookups (%i lookups saved)' % (len(self.resolved), self.trackLookups, self.trackLookups - len(self.resolved)))
+
+#Counts a name that was not found in the lookup, in the misses list if one is given, otherwise in the miss report
+def recordMiss(name, role, misses):
+    if misses is not None:
+        misses.append((name, role))
+    else:
+        missReport.record(name, role)
+
+#Looks up a name from the given tag (the role) in a snapshot of the lookup. Returns the ArtistLookup or None.
+#When a batch is given, the name is resolved through it.
+#Names not in the lookup as spelled are looked up phonetically, to catch transliteration variants. A composer, conductor or orchestra tag
+#already holds a name, so a phonetic match for one also has to pass the similarity check on the full names before it replaces the tag.
+#Names that keep missing skip makeKey through the miss cache. Every miss is counted in the miss report, or added to the misses list if one is given.
+def lookupArtist(lookup, name, role, misses=None, batch=None):
+    global missCache
+    if batch is not None:
+        return batch.resolve(lookup, name, role, misses)
+    cache = missCache
+    if cache.signature != lookup.version:
+        cache = missCache = LRUCache(MISS_CACHE_SIZE, signature=lookup.version)
+    strict = role in ROLE_TAGS
+    if not cache.get((name, strict)):
+        key = makeKey(name)
+        if key in lookup.artists:
+            return lookup.artists[key]
+        phoneticMatch = lookup.phoneticIndex().match(key)
+        if phoneticMatch and (not strict or AreSimilar(name.lower(), lookup.artists[phoneticMatch].name.lower())):
+            log.info('CLASSICAL FIXES: Matched ' + name + ' to ' + lookup.artists[phoneticMatch].name + ' by sound')
+            return lookup.artists[phoneticMatch]
+        log.debug('CLASSICAL FIXES: No ' + role + ' found for key: ' + key)
+        cache.put((name, strict), True)
+    recordMiss(name, role, misses)
+    return None
+
+#Returns True if the file has no value for the tag
+def isMissing(f, tag):
+    return tag not in f.metadata or f.metadata[tag] == ''
+
+#Fills the composer, conductor or orchestra tag from a lookup record when the file does not have one yet.
+def fillRoleFromArtist(f, foundArtist, source):
+    if foundArtist.primaryrole =='Orchestra' and isMissing(f, 'orchestra'):
+        log.info('CLASSICAL FIXES: assigning orchestra from ' + source + ': ' + foundArtist.name)
+        f.metadata['orchestra'] = foundArtist.name
+    if foundArtist.primaryrole =='Conductor' and isMissing(f, 'conductor'):
+        log.info('CLASSICAL FIXES: assigning conductor from ' + source + ': ' + foundArtist.name)
+        f.metadata['conductor'] = foundArtist.name
+    if foundArtist.primaryrole =='Composer' and isMissing(f, 'composer'):
+        log.info('CLASSICAL FIXES: assigning composer from ' + source + ': ' + foundArtist.name)
+        f.metadata['composer'] = foundArtist.name
+        f.metadata['composer view'] = foundArtist.sortorderwithdates
+        f.metadata['composersort'] = foundArtist.sortorder
+        f.metadata['epoque'] = foundArtist.primaryepoque
 
 def somethingChanged(new, orig):
     #log.debug(str(new.rawitems))
@@ -346,185 +1145,17 @@ def somethingChanged(new, orig):
     #log.debug(str(newcopy))
     return newcopy != orig
 
-#performs classical fixes on the file passed. This is the bulk of the implementation
-def fixFile(f):
+#performs classical fixes on the file passed. This is the bulk of the implementation. Artist names are taken from the batch when one is given.
+def fixFile(f, batch=None):
     try:
         log.info('CLASSICAL FIXES: Processing ' + str(f))
         
         savedMetadata = copy.deepcopy(f.metadata)
         
-        trackArtists = []
-        trackAlbumArtists = []
-        global artistLookup
-        global regexes
-
-        #fill arrays for artist and album artist
-        if 'artist' in f.metadata:
-            trackArtists = expandList(f.metadata['artist'])
-
-        log.debug ('Normalized track artists: ' + str(trackArtists))
-
-        if 'album artist' in f.metadata and 'albumartist' not in f.metadata:
-            log.debug('CLASSICAL FIXES: Have album artist but no albumartist: ' + f.metadata['album artist'])
-            f.metadata['albumArtist'] = f.metadata['album artist']
-
-        if 'albumartist' in f.metadata:
-            trackAlbumArtists = expandList(f.metadata['albumartist'])        
-
-        log.debug('Normalized track albumartists: ' + str(trackAlbumArtists))
-        
-        #Find missing composer, orchestra, and conductor
-        #log.debug('CLASSICAL FIXES: Checking artists to fill conductor, composer, and orchestra tags if needed.')
-        for trackArtist in trackArtists:
-            trackArtistKey = makeKey(trackArtist)
-            if trackArtistKey in artistLookup:
-                foundArtist = artistLookup[trackArtistKey]
-                if foundArtist.primaryrole =='Orchestra' and ('orchestra' not in f.metadata or f.metadata['orchestra'] == ''):
-                    log.info('CLASSICAL FIXES: assigning orchestra from artist tag: ' + foundArtist.name)
-                    f.metadata['orchestra'] = foundArtist.name
-                if foundArtist.primaryrole =='Conductor' and ('conductor' not in f.metadata or f.metadata['conductor'] == ''):
-                    log.info('CLASSICAL FIXES: assigning conductor from artist tag: ' + foundArtist.name)
-                    f.metadata['conductor'] = foundArtist.name
-                if foundArtist.primaryrole =='Composer' and ('composer' not in f.metadata or f.metadata['composer'] == ''):
-                    log.info('CLASSICAL FIXES: assigning composer from artist tag: ' + foundArtist.name)
-                    f.metadata['composer'] = foundArtist.name
-                    f.metadata['composer view'] = foundArtist.sortorderwithdates
-                    f.metadata['composersort'] = foundArtist.sortorder
-                    f.metadata['epoque'] = foundArtist.primaryepoque
-            else:
-                log.debug('CLASSICAL FIXES: No artists found for key: ' + trackArtistKey)
-
-        #log.debug('CLASSICAL FIXES: Checking album artists to fill conductor, composer, and orchestra tags if needed.')
-        for albumArtist in trackAlbumArtists:
-            trackAlbumArtistKey = makeKey(albumArtist)
-            if trackAlbumArtistKey in artistLookup:
-                foundArtist = artistLookup[trackAlbumArtistKey]
-                if foundArtist.primaryrole =='Orchestra' and ('orchestra' not in f.metadata or f.metadata['orchestra'] == ''):
-                    log.info('CLASSICAL FIXES: assigning orchestra from albumartist tag: ' + foundArtist.name)
-                    f.metadata['orchestra'] = foundArtist.name
-                if foundArtist.primaryrole =='Conductor' and ('conductor' not in f.metadata or f.metadata['conductor'] == ''):
-                    log.info('CLASSICAL FIXES: assigning conductor from albumartist tag: ' + foundArtist.name)
-                    f.metadata['conductor'] = foundArtist.name
-                if foundArtist.primaryrole =='Composer' and ('composer' not in f.metadata or f.metadata['composer'] == ''):
-                    log.info('CLASSICAL FIXES: assigning composer from albumartist tag: ' + foundArtist.name)
-                    f.metadata['composer'] = foundArtist.name
-                    f.metadata['composer view'] = foundArtist.sortorderwithdates
-                    f.metadata['composersort'] = foundArtist.sortorder
-                    f.metadata['epoque'] = foundArtist.primaryepoque
-            else:
-                log.debug('CLASSICAL FIXES: No albumartists found for key: ' + trackAlbumArtistKey)
-        
-        #if there is a composer, look it up against the list and replace what is there if it is different.
-        #same with view.
-        #If there is more than one composer, do nothing.
-        #log.debug('CLASSICAL FIXES: Looking up composer')
-        if 'composer' in f.metadata and f.metadata['composer'] != '' and len(expandList(f.metadata['composer'])) ==1:
-            #log.debug('CLASSICAL FIXES: There is one composer: ' + str(f.metadata['composer']))
-            composerKey = makeKey(f.metadata['composer'])
-            #log.debug('CLASSICAL FIXES: Composerkey: ' + composerKey)
-            if composerKey in artistLookup:
-                foundComposer = artistLookup[composerKey]
-                if foundComposer.primaryrole == 'Composer':
-                    log.info('CLASSICAL FIXES: Found composer in lookup - setting tags: name-' + foundComposer.name + '|sowd-' + foundComposer.sortorderwithdates)
-                    f.metadata['composer'] = foundComposer.name
-                    f.metadata['composer view'] = foundComposer.sortorderwithdates
-                    f.metadata['composersort'] = foundComposer.sortorder
-                    if foundComposer.primaryepoque:
-                        f.metadata['epoque'] = foundComposer.primaryepoque
-            else:
-                if 'composer view' not in f.metadata:
-                    #there is a composer, but it was not found on lookup. Make Last, First Composer view tag
-                    log.info('CLASSICAL FIXES: Composer not found in lookup. Fabricating composer view tag.')
-                    f.metadata['composer view'] = reverseName(f.metadata['composer'])
-                    f.metadata['composersort'] = f.metadata['composer view']
-
-        #if there is a conductor, normalize against lookup if found
-        #log.debug('CLASSICAL FIXES: Looking up conductor')
-        if 'conductor' in f.metadata and f.metadata['conductor'] != '':
-            #log.debug('CLASSICAL FIXES: There is a conductor')
-            conductorKey = makeKey(f.metadata['conductor'])
-            if conductorKey in artistLookup:
-                foundConductor = artistLookup[conductorKey]
-                if foundConductor.primaryrole == 'Conductor':
-                    log.info('CLASSICAL FIXES: Found conductor in lookup. Setting name')
-                    f.metadata['conductor'] = foundConductor.name
-
-        #if there is an orchestra, normalize against lookup if found
-        #log.debug('CLASSICAL FIXES: Looking up orchestra')
-        if 'orchestra' in f.metadata and f.metadata['orchestra'] != '':
-            #log.debug('CLASSICAL FIXES: There is an orchestra')
-            orchKey = makeKey(f.metadata['orchestra'])
-            if orchKey in artistLookup:
-                foundOrchestra = artistLookup[orchKey]
-                if foundOrchestra.primaryrole == 'Orchestra':
-                    log.info('CLASSICAL FIXES: Found orchestra in lookup. Setting name')
-                    f.metadata['orchestra'] = foundOrchestra.name                    
-
-                
-        #if there is no orchestra, but there is an artist tag that contains a name that looks like an orchestra, use that
-        if 'orchestra' not in f.metadata:
-            for artist in trackArtists:
-                if ORCH_RE.search(artist):
-                    log.info('CLASSICAL FIXES: Found something that looks like an orchestra in the artist tags. Setting orchestra to ' + artist)
-                    f.metadata['orchestra'] = artist
-                    break
-
-        #if there is no orchestra, but there is an album artist tag that contains a name that looks like an orchestra, use that
-        if 'orchestra' not in f.metadata:
-            for artist in trackAlbumArtists:
-                if ORCH_RE.search(artist):
-                    log.info('CLASSICAL FIXES: Found something that looks like an orchestra in the album artist tags. Setting orchestra to ' + artist)
-                    f.metadata['orchestra'] = artist
-                    break
-
-        #if there is a conductor or an orchestra tag, and either are in the album artist tag, rearrange
-        log.debug('CLASSICAL FIXES: checking for conductor and orchestra in album artists.')
-        trackAlbumArtists = rearrangeArtists(trackAlbumArtists, f)
-
-        #if there is a conductor or an orchestra tag, and either are in the album artist tag, rearrange
-        log.debug('CLASSICAL FIXES: checking for conductor and orchestra in artists.')
-        trackArtists = rearrangeArtists(trackArtists, f)
-       
-        #if there is a composer tag, and it also exists in track or album artists, remove it.
-        if 'composer' in f.metadata:
-            log.debug('CLASSICAL FIXES: Searching for composer in artist and album artist tags')
-            newArtists = []
-            newAlbumArtistTag = []
-            for artist in trackArtists:
-                if not AreSimilar(artist.strip().lower(), f.metadata['composer'].strip().lower()):
-                    newArtists.append(artist.strip())
-            if newArtists:
-                trackArtists = newArtists
-                    
-            for albumArtist in trackAlbumArtists:
-                if not AreSimilar(albumArtist.strip().lower(), f.metadata['composer'].strip().lower()):
-                    newAlbumArtistTag.append(albumArtist.strip())
-            if newAlbumArtistTag:
-                trackAlbumArtists = newAlbumArtistTag
-        
-        log.info('Setting album artist to: ' + '; '.join(trackAlbumArtists))
-        f.metadata['albumartist'] = '; '.join(trackAlbumArtists)
-        
-        log.info('Setting artists to: ' + str(trackArtists))        
-        f.metadata['artist'] = trackArtists
-
-        if f.metadata['albumartist'] == 'Various':
-            f.metadata['albumartist'] = 'Various Artists'
-        
-        if 'artist' not in f.metadata and 'albumartist' in f.metadata:
-            log.info('CLASSICAL FIXES: No artist tag found, but there is an album artist. Using album artist.')
-            f.metadata['artist'] = f.metadata['albumartist'].split('; ')
-            
-        if 'albumartist' not in f.metadata and 'artist' in f.metadata:
-            log.info('CLASSICAL FIXES: No album artist tag found, but there is an artist. Using artist.')
-            if isinstance(f.metadata['artist'], str):
-                f.metadata['albumartist'] = f.metadata['artist']
-            else:
-                f.metadata['albumartist'] = '; '.join(str(e) for e in f.metadata['artist'])
-
-
-        f.metadata['album artist'] = f.metadata['albumartist']
+        lookup = lookupStore.snapshot()
 
+        #fill in and normalize the composer, conductor, orchestra, artist and album artist tags
+        resolveArtistTags(f, lookup, batch)
 
         #remove [] in album title, except for live, bootleg, flac*, mp3* dsd* dsf* and [import], [44k][192][196][88][mqa]
         #actually this would be better if if just looked for conductor including last name in the brackets
@@ -537,20 +1168,14 @@ def fixFile(f):
 
         #regexes for title and album name
         log.debug('CLASSICAL FIXES: Executing regex substitutions')
-        for regex in regexes:
-            #log.debug(regex[0] + ' - ' + regex[1]) 
-            trackName = f.metadata['title']
-            albumName = f.metadata['album']
-            #log.debug('CLASSICAL FIXES: Was: ' + trackName + ' | ' + albumName)
-            trackName = re.sub(regex[0], regex[1], trackName)
-            albumName = re.sub(regex[0], regex[1], albumName)
-            #log.debug('CLASSICAL FIXES: Is now: ' + trackName + ' | ' + albumName)
-            if f.metadata['title'] != trackName:
-                log.info('CLASSICAL FIXES: Fixing title: ' + trackName)
-                f.metadata['title'] = trackName
-            if f.metadata['album'] != albumName:
-                log.info('CLASSICAL FIXES: Fixing album: ' + albumName)
-                f.metadata['album'] = albumName
+        trackName = normalizeTitle(f.metadata['title'])
+        albumName = normalizeTitle(f.metadata['album'])
+        if f.metadata['title'] != trackName:
+            log.info('CLASSICAL FIXES: Fixing title: ' + trackName)
+            f.metadata['title'] = trackName
+        if f.metadata['album'] != albumName:
+            log.info('CLASSICAL FIXES: Fixing album: ' + albumName)
+            f.metadata['album'] = albumName
 
 
         #log.debug('CLASSICAL FIXES: Fixing genre')
@@ -569,6 +1194,7 @@ def fixFile(f):
         if somethingChanged(f.metadata, savedMetadata):
             log.debug('Something changed. Updating.')
             f.metadata['classicalfixesdate'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            undoJournal.recordChanges(f, savedMetadata)
             f.update()
         else:
             log.debug('Nothing changed for this file.')
@@ -577,11 +1203,8 @@ def fixFile(f):
     except Exception as e:
         log.error('CLASSICAL FIXES: An error occured fixing the file: ' + str(e))
 
-#Processes classic fixes on a group of files. It has some rollback features to ensure album level information doesn't get inconsistent.
-def ProcessListOfFiles(objs):
-    #If all of the track album titles and album artists are the same before hand, they should all be the same after
-    
-    #Cache the before picture
+#Captures the album level picture of a group of files: the album name and album artists, and whether they are the same on all of the files.
+def albumConsistency(objs):
     albumName = ''
     albumArtists = ''
     albumsAllSame = True
@@ -596,51 +1219,333 @@ def ProcessListOfFiles(objs):
             albumArtists = track.metadata['albumartist']
         if track.metadata['album'] != albumName:
             albumsAllSame = False
-            log.debug('CLASSICAL FIXES: Not all original album names the same')
+            log.debug('CLASSICAL FIXES: Not all album names the same')
         if track.metadata['albumartist'] != albumArtists:
             albumArtistsAllSame = False
-            log.debug('CLASSICAL FIXES: Not all original album artists the same')
-    
-    #Do the processing
-    for track in objs:    
-        if not track or not track.metadata:
-            log.debug('CLASSICAL FIXES: No file/metadata/title for file')
-            continue                
-                        
-        fixFile(track)
-        track.update()
-        
-    #Check to see if rollback is needed.
-    
-    newalbumName = ''
-    newalbumArtists = ''
-    newalbumsAllSame = True
-    newalbumArtistsAllSame = True
-    for track in objs:
-        if not track or not track.metadata:
-            log.debug('CLASSICAL FIXES: No file/metadata/title for file')
-            continue                
-        if not newalbumName:
-            newalbumName = track.metadata['album']
-        if not newalbumArtists:
-            newalbumArtists = track.metadata['albumartist']
-        if track.metadata['album'] != newalbumName:
-            newalbumsAllSame = False
-            log.debug('CLASSICAL FIXES: Not all new album names the same')
-        if track.metadata['albumartist'] != newalbumArtists:
-            newalbumArtistsAllSame = False
-            log.debug('CLASSICAL FIXES: Not all new album artists the same')
+            log.debug('CLASSICAL FIXES: Not all album artists the same')
+    return albumName, albumArtists, albumsAllSame, albumArtistsAllSame
+
+#If all of the track album titles and album artists were the same before the fixes (as captured by albumConsistency), they should all be the same after. Rolls back the ones that are not.
+def rollbackAlbumConsistency(objs, before):
+    albumName, albumArtists, albumsAllSame, albumArtistsAllSame = before
+    newalbumName, newalbumArtists, newalbumsAllSame, newalbumArtistsAllSame = albumConsistency(objs)
                     
     for track in objs:
+        if not track or not track.metadata:
+            continue
         if albumArtistsAllSame and not newalbumArtistsAllSame:
             #rollback albumartists
             log.debug('CLASSICAL FIXES: Rolling back album artists.')
+            undoJournal.record(track, 'albumartist')
+            undoJournal.record(track, 'album artist')
             track.metadata['albumartist'] = albumArtists
             track.metadata['album artist'] = albumArtists
         if albumsAllSame and not newalbumsAllSame:
             log.debug('CLASSICAL FIXES: Rolling back album name')
+            undoJournal.record(track, 'album')
             track.metadata['album'] = albumName
 
+#The artist resolution part of the classical fixes: fills in missing composer, conductor and orchestra tags from the artist tags and normalizes them
+#against a snapshot of the lookup, then rearranges the artist and album artist tags. Misses are added to the misses list as (name, role).
+#Returns True if the album title was used, which only happens when a role could not be filled from the artist tags. Names are taken from the batch when one is given.
+def resolveArtists(f, lookup, misses, batch=None):
+    trackArtists = []
+    trackAlbumArtists = []
+
+    #fill arrays for artist and album artist
+    if 'artist' in f.metadata:
+        trackArtists = expandList(f.metadata['artist'])
+
+    log.debug ('Normalized track artists: ' + str(trackArtists))
+
+    if 'album artist' in f.metadata and 'albumartist' not in f.metadata:
+        log.debug('CLASSICAL FIXES: Have album artist but no albumartist: ' + f.metadata['album artist'])
+        f.metadata['albumArtist'] = f.metadata['album artist']
+
+    if 'albumartist' in f.metadata:
+        trackAlbumArtists = expandList(f.metadata['albumartist'])        
+
+    log.debug('Normalized track albumartists: ' + str(trackAlbumArtists))
+    
+    #Find missing composer, orchestra, and conductor
+    #log.debug('CLASSICAL FIXES: Checking artists to fill conductor, composer, and orchestra tags if needed.')
+    for trackArtist in trackArtists:
+        foundArtist = lookupArtist(lookup, trackArtist, 'artist', misses, batch)
+        if foundArtist:
+            fillRoleFromArtist(f, foundArtist, 'artist tag')
+
+    #log.debug('CLASSICAL FIXES: Checking album artists to fill conductor, composer, and orchestra tags if needed.')
+    for albumArtist in trackAlbumArtists:
+        foundArtist = lookupArtist(lookup, albumArtist, 'albumartist', misses, batch)
+        if foundArtist:
+            fillRoleFromArtist(f, foundArtist, 'albumartist tag')
+
+    #if a role is still missing, look for known artists anywhere in the artist, album artist and album strings. Last name aliases are not used on album titles, where they are too noisy.
+    usedAlbum = False
+    for source, aliases in [('artist', True), ('albumartist', True), ('album', False)]:
+        if not (isMissing(f, 'composer') or isMissing(f, 'conductor') or isMissing(f, 'orchestra')):
+            break
+        if source in f.metadata:
+            usedAlbum = source == 'album'
+            text = f.metadata[source]
+            #full names go first, so a composer named in full wins over a last name elsewhere in the string
+            for start, end, foundArtist, oneWord in sorted(longestMatches(lookup.matcher().find(text, aliases)), key=lambda m: m[3]):
+                #a last name next to other names, as in "Gould - Bach Goldberg Variations", is more often a performer than the composer
+                if oneWord and foundArtist.primaryrole == 'Composer' and text[start:end] != text.strip():
+                    continue
+                fillRoleFromArtist(f, foundArtist, source + ' string')
+    
+    #if there is a composer, look it up against the list and replace what is there if it is different.
+    #same with view.
+    #If there is more than one composer, do nothing.
+    #log.debug('CLASSICAL FIXES: Looking up composer')
+    if 'composer' in f.metadata and f.metadata['composer'] != '' and len(expandList(f.metadata['composer'])) ==1:
+        #log.debug('CLASSICAL FIXES: There is one composer: ' + str(f.metadata['composer']))
+        foundComposer = lookupArtist(lookup, f.metadata['composer'], 'composer', misses, batch)
+        if foundComposer:
+            if foundComposer.primaryrole == 'Composer':
+                log.info('CLASSICAL FIXES: Found composer in lookup - setting tags: name-' + foundComposer.name + '|sowd-' + foundComposer.sortorderwithdates)
+                f.metadata['composer'] = foundComposer.name
+                f.metadata['composer view'] = foundComposer.sortorderwithdates
+                f.metadata['composersort'] = foundComposer.sortorder
+                if foundComposer.primaryepoque:
+                    f.metadata['epoque'] = foundComposer.primaryepoque
+        else:
+            if 'composer view' not in f.metadata:
+                #there is a composer, but it was not found on lookup. Make Last, First Composer view tag
+                log.info('CLASSICAL FIXES: Composer not found in lookup. Fabricating composer view tag.')
+                f.metadata['composer view'] = reverseName(f.metadata['composer'])
+                f.metadata['composersort'] = f.metadata['composer view']
+
+    #if there is a conductor, normalize against lookup if found
+    #log.debug('CLASSICAL FIXES: Looking up conductor')
+    if 'conductor' in f.metadata and f.metadata['conductor'] != '':
+        #log.debug('CLASSICAL FIXES: There is a conductor')
+        foundConductor = lookupArtist(lookup, f.metadata['conductor'], 'conductor', misses, batch)
+        if foundConductor:
+            if foundConductor.primaryrole == 'Conductor':
+                log.info('CLASSICAL FIXES: Found conductor in lookup. Setting name')
+                f.metadata['conductor'] = foundConductor.name
+
+    #if there is an orchestra, normalize against lookup if found
+    #log.debug('CLASSICAL FIXES: Looking up orchestra')
+    if 'orchestra' in f.metadata and f.metadata['orchestra'] != '':
+        #log.debug('CLASSICAL FIXES: There is an orchestra')
+        foundOrchestra = lookupArtist(lookup, f.metadata['orchestra'], 'orchestra', misses, batch)
+        if foundOrchestra:
+            if foundOrchestra.primaryrole == 'Orchestra':
+                log.info('CLASSICAL FIXES: Found orchestra in lookup. Setting name')
+                f.metadata['orchestra'] = foundOrchestra.name                    
+
+            
+    #if there is no orchestra, but there is an artist tag that contains a name that looks like an orchestra, use that
+    if 'orchestra' not in f.metadata:
+        for artist in trackArtists:
+            if ORCH_RE.search(artist):
+                log.info('CLASSICAL FIXES: Found something that looks like an orchestra in the artist tags. Setting orchestra to ' + artist)
+                f.metadata['orchestra'] = artist
+                break
+
+    #if there is no orchestra, but there is an album artist tag that contains a name that looks like an orchestra, use that
+    if 'orchestra' not in f.metadata:
+        for artist in trackAlbumArtists:
+            if ORCH_RE.search(artist):
+                log.info('CLASSICAL FIXES: Found something that looks like an orchestra in the album artist tags. Setting orchestra to ' + artist)
+                f.metadata['orchestra'] = artist
+                break
+
+    #if there is a conductor or an orchestra tag, and either are in the album artist tag, rearrange
+    log.debug('CLASSICAL FIXES: checking for conductor and orchestra in album artists.')
+    trackAlbumArtists = rearrangeArtists(trackAlbumArtists, f)
+
+    #if there is a conductor or an orchestra tag, and either are in the album artist tag, rearrange
+    log.debug('CLASSICAL FIXES: checking for conductor and orchestra in artists.')
+    trackArtists = rearrangeArtists(trackArtists, f)
+   
+    #if there is a composer tag, and it also exists in track or album artists, remove it.
+    if 'composer' in f.metadata:
+        log.debug('CLASSICAL FIXES: Searching for composer in artist and album artist tags')
+        newArtists = []
+        newAlbumArtistTag = []
+        for artist in trackArtists:
+            if not AreSimilar(artist.strip().lower(), f.metadata['composer'].strip().lower()):
+                newArtists.append(artist.strip())
+        if newArtists:
+            trackArtists = newArtists
+                
+        for albumArtist in trackAlbumArtists:
+            if not AreSimilar(albumArtist.strip().lower(), f.metadata['composer'].strip().lower()):
+                newAlbumArtistTag.append(albumArtist.strip())
+        if newAlbumArtistTag:
+            trackAlbumArtists = newAlbumArtistTag
+    
+    log.info('Setting album artist to: ' + '; '.join(trackAlbumArtists))
+    f.metadata['albumartist'] = '; '.join(trackAlbumArtists)
+    
+    log.info('Setting artists to: ' + str(trackArtists))        
+    f.metadata['artist'] = trackArtists
+
+    if f.metadata['albumartist'] == 'Various':
+        f.metadata['albumartist'] = 'Various Artists'
+    
+    if 'artist' not in f.metadata and 'albumartist' in f.metadata:
+        log.info('CLASSICAL FIXES: No artist tag found, but there is an album artist. Using album artist.')
+        f.metadata['artist'] = f.metadata['albumartist'].split('; ')
+        
+    if 'albumartist' not in f.metadata and 'artist' in f.metadata:
+        log.info('CLASSICAL FIXES: No album artist tag found, but there is an artist. Using artist.')
+        if isinstance(f.metadata['artist'], str):
+            f.metadata['albumartist'] = f.metadata['artist']
+        else:
+            f.metadata['albumartist'] = '; '.join(str(e) for e in f.metadata['artist'])
+
+
+    f.metadata['album artist'] = f.metadata['albumartist']
+
+    return usedAlbum
+
+#Runs resolveArtists for a file. The result only depends on the input tags and the lookup, so it is kept in a persistent cache keyed by the input tags
+#and a signature of the lookup contents. Repeated performer combinations skip the lookups and similarity checks entirely.
+#Most results don't depend on the album title. Those that do are stored under a second key that includes it.
+def resolveArtistTags(f, lookup, batch=None):
+    global resolveCache
+    signature = rulesSignature([RESOLVE_RULES, lookup.digest()])
+    if resolveCache.signature != signature:
+        resolveCache = LRUCache(RESOLVE_CACHE_SIZE, RESOLVE_CACHE_FILE, signature)
+    cache = resolveCache
+    
+    inputs = [f.metadata.getall(tag) for tag in RESOLVE_INPUT_TAGS]
+    key = json.dumps(inputs)
+    albumKey = json.dumps([inputs, f.metadata.getall('album')])
+    result = cache.get(key)
+    if result == ALBUM_DEPENDENT:
+        result = cache.get(albumKey)
+    
+    if result is None:
+        tags = Metadata()
+        for tag, values in zip(RESOLVE_INPUT_TAGS + ['album'], inputs + [f.metadata.getall('album')]):
+            if values:
+                tags[tag] = values
+        misses = []
+        usedAlbum = resolveArtists(types.SimpleNamespace(metadata=tags), lookup, misses, batch)
+        result = {'tags': {tag: tags.getall(tag) for tag in RESOLVE_OUTPUT_TAGS}, 'misses': misses}
+        if usedAlbum:
+            cache.put(key, ALBUM_DEPENDENT)
+            cache.put(albumKey, result)
+        else:
+            cache.put(key, result)
+    else:
+        log.debug('CLASSICAL FIXES: Using cached artist resolution')
+    
+    for name, role in result['misses']:
+        missReport.record(name, role)
+    for tag, values in result['tags'].items():
+        if values != f.metadata.getall(tag):
+            if values:
+                f.metadata[tag] = values
+            elif tag in f.metadata:
+                del f.metadata[tag]
+
+#Processes classic fixes on a group of files. It has some rollback features to ensure album level information doesn't get inconsistent.
+#The batch resolves each distinct artist name once. Actions pass one batch for their whole selection and report it when done.
+def ProcessListOfFiles(objs, batch=None):
+    lookupStore.refresh()
+
+    #Cache the before picture
+    before = albumConsistency(objs)
+    
+    ownBatch = batch is None
+    if ownBatch:
+        batch = NameBatch(lookupStore.snapshot())
+    
+    #Do the processing
+    for track in objs:    
+        if not track or not track.metadata:
+            log.debug('CLASSICAL FIXES: No file/metadata/title for file')
+            continue                
+                        
+        fixFile(track, batch)
+        track.update()
+    if ownBatch:
+        batch.report()
+        
+    #Check to see if rollback is needed.
+    rollbackAlbumConsistency(objs, before)
+
+#Does classical fixes as files finish loading, instead of waiting for a menu action on the whole selection.
+#Loaded files are queued and fixed a few at a time on the main thread. The album level rollback is deferred until loading settles,
+#and is then done for each group of files that shared the same album and album artists before they were fixed, the same way Picard clusters them.
+#Everything done from the first queued file until then is one action in the undo journal.
+class FixOnLoadProcessor():
+
+    def __init__(self):
+        self.queue = deque()
+        self.pendingAlbums = {}
+        self.undoAction = None
+        self.timer = None
+        self.settleTimer = None
+
+    #post load processor. Picard may call this from a worker thread, so the scheduling is handed to the main thread.
+    def __call__(self, f):
+        self.queue.append(f)
+        thread.to_main(self.schedule)
+
+    def schedule(self):
+        if self.timer is None:
+            self.timer = QtCore.QTimer()
+            self.timer.setInterval(FIX_ON_LOAD_INTERVAL)
+            self.timer.timeout.connect(self.processBatch)
+            self.settleTimer = QtCore.QTimer()
+            self.settleTimer.setSingleShot(True)
+            self.settleTimer.setInterval(FIX_ON_LOAD_SETTLE)
+            self.settleTimer.timeout.connect(self.finalizeAlbums)
+        self.settleTimer.stop()
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def processBatch(self):
+        try:
+            undoJournal.resume(self.undoAction, 'Classical fixes on load')
+            lookupStore.refresh()
+            files = []
+            while self.queue and len(files) < FIX_ON_LOAD_BATCH_SIZE:
+                f = self.queue.popleft()
+                if not f or not f.metadata or f.state == File.REMOVED:
+                    continue
+                files.append(f)
+            batch = NameBatch(lookupStore.snapshot())
+            for f in files:
+                albumKey = (f.metadata['album'], f.metadata['albumartist'])
+                self.pendingAlbums.setdefault(albumKey, []).append(f)
+                fixFile(f, batch)
+            log.debug('CLASSICAL FIXES: Fixed %i files on load. %i still queued.' % (len(files), len(self.queue)))
+        except Exception as e:
+            log.error('CLASSICAL FIXES: An error has occurred fixing files on load: ' + str(e))
+        self.undoAction = undoJournal.suspend()
+        if not self.queue:
+            self.timer.stop()
+            self.settleTimer.start()
+
+    def finalizeAlbums(self):
+        if self.queue:
+            return
+        undoJournal.resume(self.undoAction, 'Classical fixes on load')
+        try:
+            log.debug('CLASSICAL FIXES: Checking album consistency for %i albums fixed on load' % len(self.pendingAlbums))
+            for (albumName, albumArtists), files in self.pendingAlbums.items():
+                files = [f for f in files if f.state != File.REMOVED]
+                rollbackAlbumConsistency(files, (albumName, albumArtists, True, True))
+                for f in files:
+                    f.update()
+        except Exception as e:
+            log.error('CLASSICAL FIXES: An error has occurred checking album consistency on load: ' + str(e))
+        finally:
+            undoJournal.commit()
+        self.undoAction = None
+        self.pendingAlbums = {}
+        saveCaches()
+
+fixOnLoadProcessor = FixOnLoadProcessor()
 
 #action for menu
 class NumberTracksInAlbumFileAction(BaseAction):
@@ -648,12 +1553,15 @@ class NumberTracksInAlbumFileAction(BaseAction):
 
     def callback(self, objs):
         
+        undoJournal.begin(self.NAME)
         try:
             log.debug('CLASSICAL FIXES: NumberTracksInAlbumFileAction called.')
             tracks = sorted(objs, key=track_key)
             RenumberFiles(tracks)
         except Exception as e:
             log.error('CLASSICAL FIXES: Error in NumberTracksInAlbumFileAction: ' + str(e))
+        finally:
+            undoJournal.commit()
 
 #action for menu
 class ComposerFileAction(BaseAction):
@@ -664,8 +1572,9 @@ class ComposerFileAction(BaseAction):
         try:
             log.debug('CLASSICAL FIXES: ComposerFileAction called.')
             
-            global artistLookup
+            lookupStore.refresh()
             
+            composers = []
             for track in objs:
                 if not track or not track.metadata:
                     log.debug('CLASSICAL FIXES: No track metadata available')
@@ -683,9 +1592,10 @@ class ComposerFileAction(BaseAction):
                 sortorder = sortOrderWithDates[:parenpos+1].strip('( ')
                 epoque = track.metadata['epoque']
                 
-                upsertArtist(artistLookup, name, sortorder, sortOrderWithDates, 'Composer', epoque)
+                composers.append((name, sortorder, sortOrderWithDates, 'Composer', epoque))
                 
-            saveArtists(artistLookup)
+            lookupStore.upsert(composers)
+            lookupStore.save()
                 
         except Exception as e:
             log.error('CLASSICAL FIXES: Error making composer: ' + str(e))
@@ -699,17 +1609,19 @@ class ConductorFileAction(BaseAction):
         try:
             log.debug('CLASSICAL FIXES: ConductorFileAction called.')
             
-            global artistLookup
+            lookupStore.refresh()
             
+            conductors = []
             for track in objs:
                 if not track or not track.metadata:
                     continue
                 if 'conductor' in track.metadata:                
                     name = track.metadata['conductor']
                     sortorder = reverseName(name)
-                    upsertArtist(artistLookup, name, sortorder, '', 'Conductor', '')
+                    conductors.append((name, sortorder, '', 'Conductor', ''))
                 
-            saveArtists(artistLookup)
+            lookupStore.upsert(conductors)
+            lookupStore.save()
                 
         except Exception as e:
             log.error('CLASSICAL FIXES: Error making conductor: ' + str(e))      
@@ -723,24 +1635,59 @@ class OrchestraFileAction(BaseAction):
         try:
             log.debug('CLASSICAL FIXES: OrchestraFileAction called.')
             
-            global artistLookup
+            lookupStore.refresh()
             
+            orchestras = []
             for track in objs:
                 if not track or not track.metadata:
                     continue
                 if 'orchestra' in track.metadata:
                     name = track.metadata['orchestra']
-                    upsertArtist(artistLookup, name, name, '', 'Orchestra', '')                
-            saveArtists(artistLookup)
+                    orchestras.append((name, name, '', 'Orchestra', ''))
+            lookupStore.upsert(orchestras)
+            lookupStore.save()
                 
         except Exception as e:
             log.error('CLASSICAL FIXES: Error making orchestra: ' + str(e)) 
     
+#action for menu
+class ExportMissesAction(BaseAction):
+    NAME = 'Export unresolved artists report'
+
+    def callback(self, objs):
+        try:
+            log.debug('CLASSICAL FIXES: ExportMissesAction called.')
+            missReport.export(lookupStore.snapshot())
+        except Exception as e:
+            log.error('CLASSICAL FIXES: Error exporting unresolved artists: ' + str(e))
+
 #action for menu    
 class FixFileAction(BaseAction):
     NAME = 'Do classical fixes on selected files'
+
+    @memoryProfiled(NAME, fileCount)
+    def callback(self, objs):
+        undoJournal.begin(self.NAME)
+        try:
+            lookupStore.refresh()
+            batch = NameBatch(lookupStore.snapshot())
+            ProcessListOfFiles(objs, batch)
+            batch.report()
+        finally:
+            undoJournal.commit()
+        saveCaches()
+
+#action for menu
+class UndoAction(BaseAction):
+    NAME = 'Undo last classical fixes action'
+
     def callback(self, objs):
-        ProcessListOfFiles(objs)
+        try:
+            log.debug('CLASSICAL FIXES: UndoAction called.')
+            if not undoJournal.undo(1):
+                log.info('CLASSICAL FIXES: Nothing to undo.')
+        except Exception as e:
+            log.error('CLASSICAL FIXES: Error undoing: ' + str(e))
 
 
 #action for menu
@@ -748,6 +1695,7 @@ class NumberTracksInAlbumClusterAction(BaseAction):
     NAME = 'Renumber tracks in albums sequentially'
 
     def callback(self, objs):
+        undoJournal.begin(self.NAME)
         try:
             log.debug('CLASSICAL FIXES: Processinging track numbers for selected clusters')
             allFiles = []
@@ -763,23 +1711,30 @@ class NumberTracksInAlbumClusterAction(BaseAction):
                 cluster.update()
         except Exception as e:
             log.error('CLASSICAL FIXES: An error has occurred in NumberTracksInAlbumClusterAction: ' + str(e))
+        finally:
+            undoJournal.commit()
         
 
 #action for menu
 class FixClusterAction(BaseAction):
     NAME = 'Do classical fixes on selected clusters'
 
+    @memoryProfiled(NAME, clusterFileCount)
     def callback(self, objs):
     
+        undoJournal.begin(self.NAME)
         try:
     
             log.debug('CLASSICAL FIXES: Classical Fixes started')
+            #resolve each distinct artist name once across all the selected clusters
+            lookupStore.refresh()
+            batch = NameBatch(lookupStore.snapshot())
             #go through the tracks in the cluster        
             for cluster in objs:
                 if not isinstance(cluster, Cluster) or not cluster.files:
                     continue
                 
-                ProcessListOfFiles(cluster.files)
+                ProcessListOfFiles(cluster.files, batch)
                 # for i, f in enumerate(cluster.files):
 
                     # if not f or not f.metadata:
@@ -788,9 +1743,13 @@ class FixClusterAction(BaseAction):
                     
                     # fixFile(f)
                 cluster.update()
+            batch.report()
                 
         except Exception as e:
             log.error('CLASSICAL FIXES: An error has occurred in FixClusterAction: ' + str(e))
+        finally:
+            undoJournal.commit()
+        saveCaches()
 
 
 
@@ -798,8 +1757,11 @@ class FixClusterAction(BaseAction):
 class CombineDiscs(BaseAction):
     NAME = 'Combine discs into single album'
 
+    @memoryProfiled(NAME, clusterFileCount)
     def callback(self, objs):
         log.debug('CLASSICAL FIXES: Combine Discs started')
+        #the validation below returns early. The finally block still commits the journal action, which is dropped if nothing changed.
+        undoJournal.begin(self.NAME)
 
             #go through the track in the cluster        
         try:
@@ -880,6 +1842,8 @@ class CombineDiscs(BaseAction):
                             else:
                                 log.debug('CLASSICAL FIXES: No date found')
                         log.info('CLASSICAL FIXES: Updating data for file: ' + f.filename)
+                        for tag in ['album', 'albumartist', 'album artist', 'discnumber', 'totaldiscs', 'date']:
+                            undoJournal.record(f, tag)
                         f.metadata['album'] = albumName
                         f.metadata['albumartist'] = albumArtist
                         f.metadata['album artist'] = albumArtist
@@ -891,6 +1855,8 @@ class CombineDiscs(BaseAction):
                 
             log.info('CLASSICAL FIXES: Setting cluster-level data')
             for cluster in objs:
+                undoJournal.record(cluster, 'album')
+                undoJournal.record(cluster, 'albumartist')
                 cluster.metadata['album'] = albumName
                 cluster.metadata['albumartist'] = albumArtist
                 cluster.update()
@@ -898,6 +1864,8 @@ class CombineDiscs(BaseAction):
                 
         except Exception as e:
             log.error('CLASSICAL FIXES: Combining error: ' + str(e))
+        finally:
+            undoJournal.commit()
         
 
 
@@ -905,12 +1873,18 @@ class CombineDiscs(BaseAction):
 register_cluster_action(CombineDiscs())
 register_cluster_action(FixClusterAction())
 register_cluster_action(NumberTracksInAlbumClusterAction())
+register_cluster_action(UndoAction())
 
 register_file_action(FixFileAction())
 register_file_action(NumberTracksInAlbumFileAction())
+register_file_action(UndoAction())
 
 register_file_action(ComposerFileAction())
 register_file_action(ConductorFileAction())
 register_file_action(OrchestraFileAction())
+register_file_action(ExportMissesAction())
+
+if FIX_ON_LOAD:
+    register_file_post_load_processor(fixOnLoadProcessor)
 
 